@@ -1,6 +1,15 @@
+import codecs
+import os
+import tempfile
+
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from charset_normalizer import from_bytes
 
 # -----------------------------------------------------------------------------
 # 1. 페이지 설정
@@ -17,74 +26,238 @@ st.markdown("한국은행/통계청 데이터를 기반으로 **주요국 통화
 # -----------------------------------------------------------------------------
 # 2. 데이터 로드 및 전처리 함수
 # -----------------------------------------------------------------------------
-@st.cache_data
+def compute_summary_stats(df_melted):
+    # (통화, 측정항목)별 최저/최고/최근 환율을 한 번에 계산 (그룹 안에서 날짜순 정렬된 데이터 기준)
+    return df_melted.groupby(['계정항목', '측정항목'], observed=True).agg(
+        min=('환율', 'min'),
+        max=('환율', 'max'),
+        last=('환율', 'last'),
+        last_date=('날짜', 'last')
+    )
+
+@st.cache_resource
 def load_and_preprocess_data():
+    # 읽기 전용 데이터이므로 cache_resource로 같은 객체를 공유 (cache_data의 매 호출 복사 비용 제거)
     file_name = "주요국 통화의 대원화환율_16153917.csv"
-    
-    # 1) 파일 읽기
-    encodings = ['utf-8', 'cp949', 'euc-kr']
-    df = None
-    
-    for enc in encodings:
+    # 전처리 결과를 저장하는 Parquet 캐시 (전처리 결과 구조가 바뀌면 버전을 올립니다)
+    cache_name = "주요국 통화의 대원화환율_16153917.v7.parquet"
+
+    # 0) CSV보다 최신인 Parquet 캐시가 있으면 CSV 파싱 없이 바로 사용 (읽기 실패 시 CSV로 다시 생성)
+    if os.path.exists(cache_name) and (
+        not os.path.exists(file_name)
+        or os.path.getmtime(cache_name) >= os.path.getmtime(file_name)
+    ):
         try:
-            df = pd.read_csv(file_name, encoding=enc)
-            break
-        except UnicodeDecodeError:
-            continue
-        except FileNotFoundError:
-            return None
-
-    if df is None:
+            df_melted = pd.read_parquet(cache_name, engine='pyarrow')
+            return df_melted, compute_summary_stats(df_melted)
+        except (OSError, pa.ArrowInvalid):
+            pass
+    
+    # 1) 인코딩 감지 (앞부분 4KB의 BOM 확인, 없으면 charset-normalizer로 추정)
+    try:
+        with open(file_name, 'rb') as f:
+            head = f.read(4096)
+    except FileNotFoundError:
+        return None, None
+
+    if head.startswith(codecs.BOM_UTF8):
+        enc = 'utf-8'
+    elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        enc = 'utf-16'
+    else:
+        best = from_bytes(head).best()
+        enc = best.encoding if best is not None else 'cp949'
+        if enc == 'ascii':
+            enc = 'utf-8'
+
+    # 2) 파일 읽기 (감지한 인코딩으로 한 번만, PyArrow 멀티스레드 CSV 파서 사용)
+    table = None
+
+    try:
+        table = pacsv.read_csv(
+            file_name,
+            read_options=pacsv.ReadOptions(encoding=enc, block_size=1 << 20)
+        )
+    except (UnicodeDecodeError, pa.ArrowInvalid):
+        pass
+
+    if table is None:
         st.error(f"❌ 파일을 찾을 수 없습니다: {file_name}")
         st.warning("같은 폴더에 csv 파일이 있는지 확인해주세요.")
-        return None
+        return None, None
 
-    # 2) 데이터 전처리 (Wide -> Long 변환)
+    # 3) 데이터 전처리 (Wide -> Long 변환)
     possible_ids = ['통계표', '계정항목', '측정항목', '단위', '변환']
-    id_vars = [col for col in possible_ids if col in df.columns]
-    date_cols = [col for col in df.columns if col not in id_vars]
-
-    df_melted = df.melt(
-        id_vars=id_vars, 
-        value_vars=date_cols,
-        var_name='날짜', 
-        value_name='환율'
-    )
+    id_vars = [col for col in possible_ids if col in table.column_names]
+    date_cols = [col for col in table.column_names if col not in id_vars]
 
-    # 3) 데이터 정제
-    # 콤마 제거
-    df_melted['환율'] = df_melted['환율'].astype(str).str.replace(',', '')
-    
-    # 숫자로 변환 (에러나 빈 값은 NaN으로 변환)
-    df_melted['환율'] = pd.to_numeric(df_melted['환율'], errors='coerce')
-    
+    # 환율 컬럼은 Arrow 안에서 콤마 제거 후 숫자로 변환 (에러나 빈 값은 NaN으로 변환)
+    # 소수 둘째 자리까지의 환율이므로 float32로도 충분합니다.
+    for col in date_cols:
+        values = table[col]
+        if pa.types.is_string(values.type):
+            values = pc.utf8_trim_whitespace(pc.replace_substring(values, ',', ''))
+            is_number = pc.match_substring_regex(values, r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+            values = pc.if_else(is_number, values, pa.scalar(None, pa.string()))
+        table = table.set_column(
+            table.schema.get_field_index(col), col, pc.cast(values, pa.float32())
+        )
+
+    df = table.to_pandas()
+
+    # df.melt 대신 NumPy 배열로 직접 Long 형태를 구성 (날짜 컬럼 순서대로 행을 쌓음)
+    # 날짜는 고유한 컬럼명만 한 번 datetime으로 변환한 뒤 반복합니다 (변환 실패 시 NaT).
+    values = df[date_cols].to_numpy()
+    n_rows, n_dates = values.shape
+
+    long_data = {col: np.tile(df[col].to_numpy(), n_dates) for col in id_vars}
+    dates = pd.to_datetime(pd.Index(date_cols), format='%Y/%m', errors='coerce')
+    long_data['날짜'] = np.repeat(dates.to_numpy(), n_rows)
+    long_data['환율'] = values.ravel(order='F')
+    df_melted = pd.DataFrame(long_data)
+
+    # 4) 데이터 정제
     # [추가된 부분] 환율 값이 없는 행(NaN)은 아예 삭제
     # 이렇게 하면 데이터가 비어있는 '독일마르크', '프랑스프랑'은 목록에서 자동으로 사라집니다.
     df_melted = df_melted.dropna(subset=['환율'])
     
-    # 날짜 변환 및 정렬
-    df_melted['날짜_dt'] = pd.to_datetime(df_melted['날짜'], format='%Y/%m', errors='coerce')
-    df_melted = df_melted.dropna(subset=['날짜_dt'])
-    df_melted = df_melted.sort_values('날짜_dt')
+    # 날짜가 아닌 컬럼에서 온 행 삭제 및 정렬
+    df_melted = df_melted.dropna(subset=['날짜'])
+
+    # 반복 필터링되는 문자열 컬럼은 Categorical로 변환 (CSV 등장 순서를 카테고리 순서로 유지)
+    # 빈 통화를 삭제한 뒤 변환하므로 사용되지 않는 카테고리는 남지 않습니다.
+    for col in ['계정항목', '측정항목', '단위']:
+        if col in df_melted.columns:
+            categories = pd.unique(df_melted[col])
+            df_melted[col] = df_melted[col].astype(pd.CategoricalDtype(categories))
+
+    # (통화, 측정항목) 정렬 MultiIndex로 저장해 필터링을 마스크 스캔 대신 범위 조회로 처리
+    # 같은 (통화, 측정항목) 안에서는 날짜순으로 정렬됩니다.
+    df_melted = df_melted.sort_values(['계정항목', '측정항목', '날짜'])
+    df_melted = df_melted.set_index(['계정항목', '측정항목'])
+
+    # 5) 다음 실행부터 CSV 파싱을 건너뛰도록 Parquet으로 저장 (쓰기 실패 시 무시)
+    # 같은 폴더의 임시 파일에 다 쓴 뒤 os.replace로 교체해, 중단되거나 동시에 쓰더라도 깨진 캐시가 남지 않도록 함
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(
+            prefix='.', suffix='.parquet', dir=os.path.dirname(os.path.abspath(cache_name))
+        )
+        os.close(fd)
+        df_melted.to_parquet(tmp_name, engine='pyarrow', compression='zstd')
+        os.replace(tmp_name, cache_name)
+    except OSError:
+        if tmp_name is not None and os.path.exists(tmp_name):
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+
+    return df_melted, compute_summary_stats(df_melted)
+
+@st.cache_data
+def filter_df(currency, measures):
+    # 선택 조건(통화, 측정항목)별로 필터링 결과를 캐시해 같은 선택의 재실행 시 다시 스캔하지 않음
+    # 정렬된 MultiIndex에서 선택한 구간만 조회합니다.
+    df, _ = load_and_preprocess_data()
+
+    if measures:
+        keys = [(currency, m) for m in measures if (currency, m) in df.index]
+    elif currency in df.index:
+        keys = [currency]
+    else:
+        keys = []
+
+    if not keys:
+        return pd.DataFrame()
+
+    return df.loc[keys].reset_index()
+
+@st.cache_data
+def get_currency_options(_df):
+    # 통화 목록과 기본값('미국달러') 위치는 데이터가 바뀌지 않는 한 고정이므로 캐시
+    # (인자 앞의 _는 Streamlit이 DataFrame 전체를 해싱하지 않도록 함)
+    currency_list = _df.index.levels[0].tolist()
+    default_index = next((i for i, c in enumerate(currency_list) if '미국달러' in str(c)), 0)
+    return currency_list, default_index
+
+@st.cache_data
+def get_measure_options(_df):
+    return _df.index.levels[1].tolist()
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets 다운샘플링: 양 끝점은 유지하고,
+    # 나머지 구간마다 이전 선택점·다음 구간 평균점과 만드는 삼각형이 가장 큰 점 하나를 고름
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
 
-    return df_melted
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+@st.cache_data
+def build_fig(currency, measures):
+    # 같은 선택이면 그래프 객체를 다시 만들지 않도록 선택 조건별로 캐시
+    sub = filter_df(currency, measures)
+
+    # SVG 대신 WebGL(Scattergl)로 측정항목별 trace를 그림
+    # 점이 많은 series는 LTTB 다운샘플링으로 모양을 유지하면서 점 개수를 줄임
+    fig = go.Figure()
+    for measure, group in sub.groupby('측정항목', observed=True):
+        x, y = group['날짜'], group['환율']
+        if len(group) > 1000:
+            # datetime 단위(ns/us)가 pandas 버전마다 다르므로 ns로 고정해 숫자로 변환
+            # 선택된 위치로 원래 값을 그대로 가져오므로 날짜를 다시 변환할 필요가 없음
+            keep = lttb_indices(
+                x.to_numpy('datetime64[ns]').view('int64').astype(np.float64),
+                y.to_numpy(dtype=np.float64),
+                1000
+            )
+            x, y = x.iloc[keep], y.iloc[keep]
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            mode='lines+markers',
+            name=str(measure)
+        ))
+    fig.update_layout(
+        title=f"{currency} 변동 그래프",
+        xaxis_title='기간',
+        yaxis_title='환율(원)',
+        legend_title_text='측정항목',
+        template="plotly_white"
+    )
+    return fig
 
 # -----------------------------------------------------------------------------
 # 3. 메인 앱 로직
 # -----------------------------------------------------------------------------
-df = load_and_preprocess_data()
+df, stats = load_and_preprocess_data()
 
 if df is not None and not df.empty:
     # --- 사이드바 필터 ---
     st.sidebar.header("검색 옵션")
     
     # 1. 통화 선택 (데이터가 있는 통화만 자동으로 뜹니다)
-    if '계정항목' in df.columns:
-        currency_list = df['계정항목'].unique()
-        
+    if '계정항목' in df.index.names:
         # 기본값 설정: '미국달러' 우선
-        default_currency = [c for c in currency_list if '미국달러' in str(c)]
-        default_index = list(currency_list).index(default_currency[0]) if default_currency else 0
+        currency_list, default_index = get_currency_options(df)
 
         selected_currency = st.sidebar.selectbox(
             "통화를 선택하세요:",
@@ -93,8 +266,8 @@ if df is not None and not df.empty:
         )
     
     # 2. 측정 항목 선택
-    if '측정항목' in df.columns:
-        measure_list = df['측정항목'].unique()
+    if '측정항목' in df.index.names:
+        measure_list = get_measure_options(df)
         selected_measure = st.sidebar.multiselect(
             "측정 기준을 선택하세요:",
             measure_list,
@@ -104,38 +277,31 @@ if df is not None and not df.empty:
         selected_measure = []
 
     # --- 데이터 필터링 ---
-    mask = (df['계정항목'] == selected_currency)
-    if selected_measure:
-        mask = mask & (df['측정항목'].isin(selected_measure))
-        
-    filtered_df = df[mask]
+    filtered_df = filter_df(selected_currency, tuple(selected_measure))
 
     # --- 시각화 ---
     if not filtered_df.empty:
         st.subheader(f"📈 {selected_currency} 환율 추이")
         
-        fig = px.line(
-            filtered_df,
-            x='날짜',
-            y='환율',
-            color='측정항목' if '측정항목' in df.columns else None,
-            markers=True,
-            title=f"{selected_currency} 변동 그래프",
-            labels={'환율': '환율(원)', '날짜': '기간'},
-            template="plotly_white"
-        )
+        fig = build_fig(selected_currency, tuple(selected_measure))
         st.plotly_chart(fig, use_container_width=True)
 
         col1, col2, col3 = st.columns(3)
-        recent_row = filtered_df.iloc[-1] 
+        # 미리 계산된 통계표에서 선택한 측정항목 행만 조회
+        summary = stats.loc[selected_currency]
+        if selected_measure:
+            summary = summary[summary.index.isin(selected_measure)]
+        recent_row = summary.sort_values('last_date').iloc[-1]
+        # 기간 내 최저/최고를 한 번의 집계로 계산
+        period = summary.agg({'min': 'min', 'max': 'max'})
         
         try:
             with col1:
-                st.metric("최근 환율", f"{recent_row['환율']:,.2f} 원", f"기준: {recent_row['날짜']}")
+                st.metric("최근 환율", f"{recent_row['last']:,.2f} 원", f"기준: {recent_row['last_date'].strftime('%Y-%m')}")
             with col2:
-                st.metric("기간 내 최저", f"{filtered_df['환율'].min():,.2f} 원")
+                st.metric("기간 내 최저", f"{period['min']:,.2f} 원")
             with col3:
-                st.metric("기간 내 최고", f"{filtered_df['환율'].max():,.2f} 원")
+                st.metric("기간 내 최고", f"{period['max']:,.2f} 원")
         except:
              st.info("통계 값을 계산할 수 없습니다.")
             
@@ -143,8 +309,9 @@ if df is not None and not df.empty:
             cols_to_show = ['날짜', '계정항목', '측정항목', '환율', '단위']
             final_cols = [c for c in cols_to_show if c in filtered_df.columns]
             st.dataframe(
-                filtered_df[final_cols].sort_values('날짜', ascending=False),
-                use_container_width=True
+                filtered_df.sort_values('날짜', ascending=False, kind='mergesort')[final_cols],
+                use_container_width=True,
+                column_config={'날짜': st.column_config.DateColumn('날짜', format='YYYY-MM')}
             )
     else:
         st.warning("선택한 조건에 맞는 데이터가 없습니다.")